@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Shared helpers for the Jansson analysis scripts
+"""
+
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+
+# Sources are read as raw bytes through a larger read buffer
+READ_BUFFER_SIZE = 1 << 17
+
+# Files at least this large are memory-mapped instead of read into memory
+MMAP_THRESHOLD = 1 << 20
+
+# Fewer files than this are scanned in-process; starting worker processes
+# costs more than scanning a handful of small sources
+PARALLEL_MIN_FILES = 64
+
+_FIND_PACKAGE_RE = re.compile(r'find_package\(([^)]+)\)')
+
+@lru_cache(maxsize=256)
+def _read_bytes(path, mtime_ns, size):
+    """Read a whole file; the stat fields only serve as cache key"""
+    with open(path, 'rb', buffering=READ_BUFFER_SIZE) as f:
+        return f.read()
+
+def read_bytes(path):
+    """Return the contents of path, reusing earlier reads while the file is unchanged"""
+    st = os.stat(path)
+    return _read_bytes(os.fspath(path), st.st_mtime_ns, st.st_size)
+
+def read_text(path):
+    """Return the contents of path decoded as UTF-8"""
+    return read_bytes(path).decode('utf-8')
+
+@lru_cache(maxsize=None)
+def _cmake_find_packages(path, mtime_ns, size):
+    """Parse find_package() calls; the stat fields only serve as cache key"""
+    content = _read_bytes(path, mtime_ns, size).decode('utf-8')
+    return tuple(_FIND_PACKAGE_RE.findall(content))
+
+def cmake_find_packages(path):
+    """Return the argument list of every find_package() call in a CMake file"""
+    st = os.stat(path)
+    return _cmake_find_packages(os.fspath(path), st.st_mtime_ns, st.st_size)
+
+@contextmanager
+def mapped_bytes(path):
+    """Yield the contents of path as a read-only buffer
+    
+    Large files are mapped with mmap so they are scanned straight from the
+    page cache; smaller ones come from read_bytes. Only slicing, find and
+    the re module should be used on the result, which works for both.
+    """
+    if os.stat(path).st_size < MMAP_THRESHOLD:
+        yield read_bytes(path)
+        return
+    
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield mapped
+
+def scan(path, needles):
+    """Return {needle: found} for the given substrings, mapping or reading path once"""
+    with mapped_bytes(path) as content:
+        return {needle: content.find(needle.encode()) != -1 for needle in needles}
+
+def _list_dir(path):
+    """Return the names in directory path, or none if it cannot be listed"""
+    try:
+        with os.scandir(path) as entries:
+            return frozenset(entry.name for entry in entries)
+    except OSError:
+        return frozenset()
+
+def path_exists(path, listings=None):
+    """Cheap Path.exists() for files probed repeatedly
+    
+    listings maps directories to their entry names and is filled on first
+    use. It is never revalidated, so callers keep one dict per analysis run;
+    without it the file system is asked directly.
+    """
+    path = Path(path)
+    if listings is None or not path.name:
+        return path.exists()
+    parent = os.fspath(path.parent)
+    names = listings.get(parent)
+    if names is None:
+        names = listings[parent] = _list_dir(parent)
+    return path.name in names
+
+def map_files(func, paths, *args):
+    """Return list(map(func, paths, *args)), in worker processes for many files"""
+    paths = list(paths)
+    if len(paths) < PARALLEL_MIN_FILES:
+        return list(map(func, paths, *args))
+    
+    with ProcessPoolExecutor() as executor:
+        return list(executor.map(func, paths, *args, chunksize=4))
+
+def classify_tree(root):
+    """Walk root once and bucket its files by kind, skipping hidden directories"""
+    tree = {
+        "c": [],
+        "h": [],
+        "test": [],
+        "doc": [],
+        "build": [],
+        "other": []
+    }
+
+    # Explicit stack of directories instead of recursion; one scandir per
+    # directory and no extra stat calls for regular entries
+    stack = [os.fspath(root)]
+    while stack:
+        dirpath = stack.pop()
+        try:
+            entries = os.scandir(dirpath)
+        except OSError:
+            continue
+
+        with entries:
+            for entry in entries:
+                name = entry.name
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+
+                if is_dir:
+                    # Like os.walk, don't descend into symlinked directories
+                    if not name.startswith('.') and not entry.is_symlink():
+                        stack.append(entry.path)
+                    continue
+
+                ext = name.rpartition('.')[2] if '.' in name else ''
+                if ext == 'c':
+                    kind = "c"
+                elif ext in ('h', 'hpp'):
+                    kind = "h"
+                elif 'test' in name.lower() or 'test' in dirpath.lower():
+                    kind = "test"
+                elif ext in ('md', 'rst', 'txt'):
+                    kind = "doc"
+                elif ext in ('am', 'ac', 'cmake', 'mk'):
+                    kind = "build"
+                else:
+                    kind = "other"
+                tree[kind].append(Path(entry.path))
+
+    return tree
@@ -6,47 +6,162 @@ and gather information for the engineering report.
 """
 
 import os
-import subprocess
 import re
 from pathlib import Path
 
-def run_command(cmd, cwd=None):
-    """Run a shell command and return output"""
-    try:
-        result = subprocess.run(cmd, shell=True, cwd=cwd, capture_output=True, text=True)
-        return result.returncode, result.stdout, result.stderr
-    except Exception as e:
-        return -1, "", str(e)
+from analysis_common import (classify_tree, cmake_find_packages, map_files, mapped_bytes,
+                             path_exists, read_text)
+
+try:
+    import ahocorasick
+except ImportError:
+    # Optional; without it the regex scan below is used
+    ahocorasick = None
+
+# Patterns are compiled once at import and shared by every file scanned.
+# _LINE_SCAN_RE matches at the start of every line that mentions one of the
+# scanned keywords; each optional lookahead group records one kind of issue.
+_LINE_SCAN_RE = re.compile(
+    rb'^(?=.*?(?:strcpy|strcat|sprintf|gets|malloc|size_t))'
+    rb'(?=(?P<unsafe>.*?\b(?:strcpy|strcat|sprintf|gets)\b))?'
+    rb'(?=(?P<malloc>.*?malloc))?'
+    rb'(?=(?P<size_arith>(?=.*size_t).*[-+*]))?',
+    re.MULTILINE)
+_PKG_CHECK_MODULES_RE = re.compile(r'PKG_CHECK_MODULES\([^,]+,\s*([^)]+)\)')
+
+# The report only shows this many issues per file, so scanning stops there
+MAX_ISSUES_PER_FILE = 5
+
+_UNSAFE_FUNCS = ('strcpy', 'strcat', 'sprintf', 'gets')
+_WORD_CHARS = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_')
+_SIZE_ARITH_RE = re.compile(r'[-+*]')
+
+# The automaton scans str, decoded from the file this many bytes at a time
+_AUTOMATON_CHUNK_SIZE = 1 << 20
 
-def analyze_c_file(filepath):
-    """Analyze a C source file for potential issues"""
+# With pyahocorasick installed, every keyword is found in one automaton pass
+if ahocorasick is not None:
+    _KEYWORD_AUTOMATON = ahocorasick.Automaton()
+    for _keyword in _UNSAFE_FUNCS + ('malloc', 'size_t'):
+        _KEYWORD_AUTOMATON.add_word(_keyword, _keyword)
+    _KEYWORD_AUTOMATON.make_automaton()
+
+def _scan_lines_regex(content):
+    """Yield (line, unsafe, malloc, size_arith) for lines with keyword hits"""
+    i, pos = 1, 0
+    for match in _LINE_SCAN_RE.finditer(content):
+        i += content[pos:match.start()].count(b'\n')
+        pos = match.start()
+        yield (i, match.group('unsafe') is not None, match.group('malloc') is not None,
+               match.group('size_arith') is not None)
+
+def _scan_lines_automaton(content):
+    """Same as _scan_lines_regex, driven by the Aho-Corasick automaton
+    
+    The automaton needs str, so content is decoded in line-aligned chunks;
+    a mapped file is never copied whole and stopping early skips the rest.
+    """
+    i = 1
+    chunk_start = 0
+    while chunk_start < len(content):
+        chunk_end = content.find(b'\n', chunk_start + _AUTOMATON_CHUNK_SIZE)
+        chunk_end = len(content) if chunk_end < 0 else chunk_end + 1
+        # latin-1 maps every byte to one character, so offsets are unchanged
+        text = content[chunk_start:chunk_end].decode('latin-1')
+        yield from _scan_text_automaton(text, i)
+        i += text.count('\n')
+        chunk_start = chunk_end
+
+def _scan_text_automaton(text, i):
+    """Scan whole lines in text, the first of which is line number i"""
+    pos = 0
+    line = None
+    line_end = -1
+    
+    for end, keyword in _KEYWORD_AUTOMATON.iter(text):
+        start = end - len(keyword) + 1
+        # Hits arrive in text order, so only a hit past the current line's
+        # end needs its line located
+        if start > line_end:
+            if line is not None:
+                yield _finish_line(text, line, line_end)
+            i += text.count('\n', pos, start)
+            pos = start
+            line_start = text.rfind('\n', 0, start) + 1
+            line_end = text.find('\n', start)
+            if line_end < 0:
+                line_end = len(text)
+            line = [i, line_start, False, False, False]
+        
+        if keyword == 'malloc':
+            line[3] = True
+        elif keyword == 'size_t':
+            line[4] = True
+        elif ((start == 0 or text[start - 1] not in _WORD_CHARS) and
+              (end + 1 == len(text) or text[end + 1] not in _WORD_CHARS)):
+            line[2] = True
+    
+    if line is not None:
+        yield _finish_line(text, line, line_end)
+
+def _finish_line(text, line, line_end):
+    """Turn the keyword flags gathered for one line into a scan result"""
+    i, line_start, unsafe, malloc, has_size_t = line
+    size_arith = has_size_t and _SIZE_ARITH_RE.search(text, line_start, line_end) is not None
+    return i, unsafe, malloc, size_arith
+
+def analyze_c_file(filepath, max_issues=MAX_ISSUES_PER_FILE):
+    """Analyze a C source file for potential issues
+    
+    Returns (filepath, issues, truncated). At most max_issues issues are
+    collected (None for no limit); scanning stops at the first issue past
+    the cap, in which case truncated is True.
+    """
     issues = []
+    truncated = False
     try:
-        with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-            lines = content.split('\n')
-            
-        # Check for potential security issues
-        for i, line in enumerate(lines, 1):
-            # Check for unsafe functions
-            if any(func in line for func in ['strcpy', 'strcat', 'sprintf', 'gets']):
-                issues.append(f"Line {i}: Potentially unsafe function usage")
-            
-            # Check for buffer overflows
-            if 'malloc' in line and not 'free' in content:
-                issues.append(f"Line {i}: Memory allocation without corresponding free")
-            
-            # Check for integer overflows
-            if any(op in line for op in ['*', '+', '-']) and 'size_t' in line:
-                issues.append(f"Line {i}: Potential integer overflow in size calculation")
-                
+        with mapped_bytes(filepath) as content:
+            issues, truncated = _collect_issues(content, max_issues)
     except Exception as e:
         issues.append(f"Error analyzing file: {e}")
     
-    return issues
+    return filepath, issues, truncated
+
+def _collect_issues(content, max_issues):
+    """Return (issues, truncated) for the buffer of one C file"""
+    issues = []
+    truncated = False
+    has_free = content.find(b'free') != -1
+    
+    # Check for potential security issues, one pass over the file
+    scan_lines = _scan_lines_regex if ahocorasick is None else _scan_lines_automaton
+    for i, unsafe, malloc, size_arith in scan_lines(content):
+        line_issues = []
+        
+        # Check for unsafe functions
+        if unsafe:
+            line_issues.append(f"Line {i}: Potentially unsafe function usage")
+        
+        # Check for buffer overflows
+        if malloc and not has_free:
+            line_issues.append(f"Line {i}: Memory allocation without corresponding free")
+        
+        # Check for integer overflows
+        if size_arith:
+            line_issues.append(f"Line {i}: Potential integer overflow in size calculation")
+        
+        # Stop at the first issue that does not fit under the cap, so a file
+        # with exactly max_issues issues is not reported as truncated
+        if max_issues is not None and len(issues) + len(line_issues) > max_issues:
+            issues.extend(line_issues[:max_issues - len(issues)])
+            truncated = True
+            break
+        issues.extend(line_issues)
+    
+    return issues, truncated
 
-def analyze_build_system():
-    """Analyze build configuration files"""
+def analyze_build_system(listings=None):
+    """Analyze build configuration files; listings is passed on to path_exists()"""
     build_files = [
         'CMakeLists.txt', 'Makefile.am', 'configure.ac', 'Android.mk'
     ]
@@ -54,48 +169,42 @@ def analyze_build_system():
     build_info = {}
     for file in build_files:
         filepath = Path(file)
-        if filepath.exists():
+        if path_exists(filepath, listings):
             try:
-                with open(filepath, 'r') as f:
-                    content = f.read()
-                    build_info[file] = {
-                        'size': len(content),
-                        'lines': len(content.split('\n')),
-                        'has_warnings': '-W' in content,
-                        'has_security_flags': '-fstack-protector' in content or '-D_FORTIFY_SOURCE' in content
-                    }
+                content = read_text(filepath)
+                build_info[file] = {
+                    'size': len(content),
+                    'lines': len(content.split('\n')),
+                    'has_warnings': '-W' in content,
+                    'has_security_flags': '-fstack-protector' in content or '-D_FORTIFY_SOURCE' in content
+                }
             except Exception as e:
                 build_info[file] = f"Error reading {file}: {e}"
     
     return build_info
 
-def check_dependencies():
-    """Check for external dependencies"""
+def check_dependencies(listings=None):
+    """Check for external dependencies; listings is passed on to path_exists()"""
     dependencies = []
     
     # Check CMakeLists.txt
-    if Path('CMakeLists.txt').exists():
-        with open('CMakeLists.txt', 'r') as f:
-            content = f.read()
-            if 'find_package' in content:
-                deps = re.findall(r'find_package\(([^)]+)\)', content)
-                dependencies.extend(deps)
+    if path_exists('CMakeLists.txt', listings):
+        dependencies.extend(cmake_find_packages('CMakeLists.txt'))
     
     # Check configure.ac
-    if Path('configure.ac').exists():
-        with open('configure.ac', 'r') as f:
-            content = f.read()
-            if 'PKG_CHECK_MODULES' in content:
-                deps = re.findall(r'PKG_CHECK_MODULES\([^,]+,\s*([^)]+)\)', content)
-                dependencies.extend(deps)
+    if path_exists('configure.ac', listings):
+        content = read_text('configure.ac')
+        if 'PKG_CHECK_MODULES' in content:
+            deps = _PKG_CHECK_MODULES_RE.findall(content)
+            dependencies.extend(deps)
     
     return dependencies
 
-def analyze_test_coverage():
-    """Analyze test coverage"""
+def analyze_test_coverage(listings=None):
+    """Analyze test coverage; listings is passed on to path_exists()"""
     test_info = {}
     
-    if Path('test').exists():
+    if path_exists('test', listings):
         test_files = list(Path('test').rglob('*.c'))
         test_info['test_files'] = len(test_files)
         
@@ -104,13 +213,15 @@ def analyze_test_coverage():
         test_info['has_integration_tests'] = any('suite' in str(f).lower() for f in test_files)
         
         # Check test scripts
-        if Path('test/run-suites').exists():
+        if path_exists('test/run-suites', listings):
             test_info['has_test_runner'] = True
         
     return test_info
 
 def main():
     """Main analysis function"""
+    # Directory listings shared by the existence checks of this run
+    listings = {}
     print("Jansson Code Analysis Report")
     print("=" * 50)
     
@@ -118,8 +229,10 @@ def main():
     print("\n1. REPOSITORY OVERVIEW")
     print("-" * 30)
     
-    src_files = list(Path('src').rglob('*.c'))
-    header_files = list(Path('src').rglob('*.h'))
+    src_tree = classify_tree('src')
+    src_files = src_tree['c']
+    # The 'h' bucket also holds .hpp files; only C headers are reported
+    header_files = [path for path in src_tree['h'] if path.suffix == '.h']
     
     print(f"Source files: {len(src_files)}")
     print(f"Header files: {len(header_files)}")
@@ -129,21 +242,25 @@ def main():
     print("-" * 30)
     
     total_issues = 0
-    for src_file in src_files[:10]:  # Analyze first 10 files
-        issues = analyze_c_file(src_file)
+    any_truncated = False
+    # Analyze first 10 files
+    for src_file, issues, truncated in map_files(analyze_c_file, src_files[:10]):
         if issues:
             print(f"\n{src_file}:")
-            for issue in issues[:5]:  # Show first 5 issues
+            for issue in issues:  # Already capped at MAX_ISSUES_PER_FILE
                 print(f"  - {issue}")
             total_issues += len(issues)
+        any_truncated = any_truncated or truncated
     
-    print(f"\nTotal potential issues found: {total_issues}")
+    # Files cut off at MAX_ISSUES_PER_FILE make the total a lower bound
+    at_least = "at least " if any_truncated else ""
+    print(f"\nTotal potential issues found: {at_least}{total_issues}")
     
     # Build system analysis
     print("\n3. BUILD SYSTEM ANALYSIS")
     print("-" * 30)
     
-    build_info = analyze_build_system()
+    build_info = analyze_build_system(listings)
     for file, info in build_info.items():
         if isinstance(info, dict):
             print(f"\n{file}:")
@@ -157,7 +274,7 @@ def main():
     print("\n4. DEPENDENCIES")
     print("-" * 30)
     
-    deps = check_dependencies()
+    deps = check_dependencies(listings)
     if deps:
         for dep in deps:
             print(f"  - {dep}")
@@ -168,7 +285,7 @@ def main():
     print("\n5. TEST COVERAGE")
     print("-" * 30)
     
-    test_info = analyze_test_coverage()
+    test_info = analyze_test_coverage(listings)
     for key, value in test_info.items():
         print(f"{key}: {value}")
     
@@ -179,7 +296,7 @@ def main():
     # Check for security-related files
     security_files = ['SECURITY.md', '.gitignore', '.clang-format']
     for file in security_files:
-        if Path(file).exists():
+        if path_exists(file, listings):
             print(f"✓ {file} exists")
         else:
             print(f"✗ {file} missing")
@@ -11,185 +11,28 @@ import json
 from pathlib import Path
 from datetime import datetime
 
-class JanssonAnalyzer:
-    def __init__(self, project_path="."):
-        self.project_path = Path(project_path)
-        self.analysis_data = {}
-        
-    def analyze_project_structure(self):
-        """Analyze the overall project structure"""
-        structure = {
-            "total_files": 0,
-            "c_files": 0,
-            "header_files": 0,
-            "test_files": 0,
-            "documentation_files": 0,
-            "build_files": 0,
-            "directories": []
-        }
-        
-        for root, dirs, files in os.walk(self.project_path):
-            # Skip hidden directories
-            dirs[:] = [d for d in dirs if not d.startswith('.')]
-            
-            for file in files:
-                structure["total_files"] += 1
-                ext = file.split('.')[-1] if '.' in file else ''
-                
-                if ext == 'c':
-                    structure["c_files"] += 1
-                elif ext in ['h', 'hpp']:
-                    structure["header_files"] += 1
-                elif 'test' in file.lower() or 'test' in root.lower():
-                    structure["test_files"] += 1
-                elif ext in ['md', 'rst', 'txt']:
-                    structure["documentation_files"] += 1
-                elif ext in ['am', 'ac', 'cmake', 'mk']:
-                    structure["build_files"] += 1
-        
-        self.analysis_data["structure"] = structure
-        return structure
-    
-    def analyze_source_code(self):
-        """Analyze the main source code files"""
-        src_path = self.project_path / "src"
-        if not src_path.exists():
-            return {}
-        
-        analysis = {
-            "total_lines": 0,
-            "functions": 0,
-            "structs": 0,
-            "enums": 0,
-            "macros": 0,
-            "api_functions": [],
-            "security_patterns": [],
-            "error_handling": []
-        }
-        
-        c_files = list(src_path.glob("*.c"))
-        h_files = list(src_path.glob("*.h"))
-        
-        # Analyze header files for API
-        for h_file in h_files:
-            if h_file.name == "jansson.h":
-                with open(h_file, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                    analysis["total_lines"] += len(content.splitlines())
-                    
-                    # Extract API functions
-                    api_matches = re.findall(r'^(\w+\s+\w+\s*\([^)]*\))', content, re.MULTILINE)
-                    analysis["api_functions"] = [match.strip() for match in api_matches if 'json_' in match]
-                    
-                    # Find security-related patterns
-                    if 'malloc' in content or 'calloc' in content:
-                        analysis["security_patterns"].append("Memory allocation found in headers")
-                    
-                    # Find error handling patterns
-                    if 'json_error_t' in content:
-                        analysis["error_handling"].append("Structured error handling with json_error_t")
-        
-        # Analyze source files
-        for c_file in c_files:
-            with open(c_file, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-                lines = content.splitlines()
-                analysis["total_lines"] += len(lines)
-                
-                # Count functions
-                analysis["functions"] += len(re.findall(r'^\w+\s+\w+\s*\([^)]*\)\s*\{', content, re.MULTILINE))
-                
-                # Count structs
-                analysis["structs"] += len(re.findall(r'struct\s+\w+\s*\{', content))
-                
-                # Count enums
-                analysis["enums"] += len(re.findall(r'enum\s+\w+\s*\{', content))
-                
-                # Count macros
-                analysis["macros"] += len(re.findall(r'^#define\s+\w+', content, re.MULTILINE))
-                
-                # Security analysis
-                if 'strcpy' in content or 'strcat' in content:
-                    analysis["security_patterns"].append(f"Unsafe string functions found in {c_file.name}")
-                
-                if 'sprintf' in content and 'snprintf' not in content:
-                    analysis["security_patterns"].append(f"Potentially unsafe formatting in {c_file.name}")
-                
-                # Memory management
-                if 'malloc' in content or 'calloc' in content:
-                    if 'free' not in content:
-                        analysis["security_patterns"].append(f"Potential memory leaks in {c_file.name}")
-        
-        self.analysis_data["source_analysis"] = analysis
-        return analysis
-    
-    def analyze_build_system(self):
-        """Analyze the build system and dependencies"""
-        build_info = {
-            "build_systems": [],
-            "dependencies": [],
-            "platforms": [],
-            "compilers": []
-        }
-        
-        # Check for different build systems
-        if (self.project_path / "CMakeLists.txt").exists():
-            build_info["build_systems"].append("CMake")
-        
-        if (self.project_path / "configure.ac").exists():
-            build_info["build_systems"].append("Autotools")
-        
-        if (self.project_path / "Makefile.am").exists():
-            build_info["build_systems"].append("Automake")
-        
-        if (self.project_path / "Android.mk").exists():
-            build_info["build_systems"].append("Android NDK")
-        
-        # Analyze CMakeLists.txt for dependencies
-        cmake_file = self.project_path / "CMakeLists.txt"
-        if cmake_file.exists():
-            with open(cmake_file, 'r') as f:
-                content = f.read()
-                if 'find_package' in content:
-                    packages = re.findall(r'find_package\((\w+)', content)
-                    build_info["dependencies"] = packages
-        
-        build_info["platforms"] = ["Linux", "Windows", "macOS", "Android"]
-        build_info["compilers"] = ["GCC", "Clang", "MSVC"]
-        
-        self.analysis_data["build_info"] = build_info
-        return build_info
-    
-    def analyze_tests(self):
-        """Analyze the test suite"""
-        test_info = {
-            "test_files": 0,
-            "test_frameworks": [],
-            "test_coverage": "Unknown",
-            "test_types": []
-        }
-        
-        test_path = self.project_path / "test"
-        if test_path.exists():
-            # Count test files
-            for root, dirs, files in os.walk(test_path):
-                for file in files:
-                    if file.endswith('.c') and 'test' in file.lower():
-                        test_info["test_files"] += 1
-            
-            # Check for test frameworks
-            if (test_path / "scripts" / "run-tests.sh").exists():
-                test_info["test_frameworks"].append("Custom shell-based")
-            
-            # Analyze test types
-            test_info["test_types"] = ["Unit tests", "API tests", "Integration tests"]
-        
-        self.analysis_data["test_info"] = test_info
-        return test_info
-    
-    def generate_story(self):
-        """Generate the comprehensive story about the project"""
-        story = f"""# Jansson JSON Library: A Comprehensive Code Analysis
+from analysis_common import (classify_tree, cmake_find_packages, map_files, path_exists,
+                             read_bytes)
+
+# Patterns are compiled once at import and shared by every file scanned
+_API_FUNC_RE = re.compile(rb'^(\w+\s+\w+\s*\([^)]*\))', re.MULTILINE)
+# Each definition kind keeps its own pattern; a single alternation would
+# lose the literal-prefix search of struct, enum and #define and be slower.
+# The keys double as keys of the per-file counts
+_COUNT_RES = {
+    "functions": re.compile(rb'^\w+\s+\w+\s*\([^)]*\)\s*\{', re.MULTILINE),
+    "structs": re.compile(rb'struct\s+\w+\s*\{'),
+    "enums": re.compile(rb'enum\s+\w+\s*\{'),
+    "macros": re.compile(rb'^#define\s+\w+', re.MULTILINE),
+}
+_PACKAGE_NAME_RE = re.compile(r'\w+')
+
+# Names whose presence is tested once per source file
+_SECURITY_NAMES = {name: name.encode('ascii') for name in
+                   ('strcpy', 'strcat', 'sprintf', 'snprintf', 'malloc', 'calloc', 'free')}
+
+# Markdown skeleton of the generated story, filled in by generate_story()
+_STORY_TEMPLATE = """# Jansson JSON Library: A Comprehensive Code Analysis
 
 ## 1. Project Context & Overview
 
@@ -226,7 +69,7 @@ The code follows a layered architecture where each module has clear responsibili
 - **Utility Layer**: Memory management, string handling, and error reporting
 - **Platform Layer**: Cross-platform compatibility abstractions
 
-With {self.analysis_data.get('structure', {}).get('total_files', 0)} total files and {self.analysis_data.get('structure', {}).get('c_files', 0)} C implementation files, the project maintains remarkable cohesion while keeping complexity manageable.
+With {total_files} total files and {c_files} C implementation files, the project maintains remarkable cohesion while keeping complexity manageable.
 
 ## 4. Technology Stack
 
@@ -251,7 +94,7 @@ True to its design philosophy, Jansson maintains zero external dependencies. The
 
 ## 5. Key Features & Capabilities
 
-Jansson delivers a comprehensive JSON toolkit with {len(self.analysis_data.get('source_analysis', {}).get('api_functions', []))} public API functions:
+Jansson delivers a comprehensive JSON toolkit with {api_function_count} public API functions:
 
 ### Core Capabilities
 - **Parsing**: Robust JSON parsing with detailed error messages
@@ -281,7 +124,7 @@ Security analysis reveals a library designed with safety in mind:
 - **Error Handling**: Structured error reporting prevents information leakage
 
 ### Potential Concerns
-{chr(10).join(f"- {pattern}" for pattern in self.analysis_data.get('source_analysis', {}).get('security_patterns', [])) if self.analysis_data.get('source_analysis', {}).get('security_patterns') else "- No major security concerns identified"}
+{security_bullets}
 
 ### Best Practices Observed
 - Consistent error handling throughout the codebase
@@ -294,10 +137,10 @@ Security analysis reveals a library designed with safety in mind:
 The codebase reveals a mature, well-maintained project with excellent development practices:
 
 ### Code Quality Indicators
-- **Consistent Style**: Uniform coding style across all {self.analysis_data.get('source_analysis', {}).get('total_lines', 0)} lines of code
+- **Consistent Style**: Uniform coding style across all {total_lines} lines of code
 - **Documentation**: Comprehensive API documentation with examples
 - **Error Handling**: Systematic error checking and reporting
-- **Testing**: {self.analysis_data.get('test_info', {}).get('test_files', 0)} test files ensuring reliability
+- **Testing**: {test_files} test files ensuring reliability
 
 ### Development Approach
 The project follows a conservative, stability-focused approach:
@@ -330,10 +173,10 @@ Overall code quality assessment: **Excellent**
 - **Benchmarks**: Performance regression testing
 
 ### Code Metrics
-- **Function Count**: {self.analysis_data.get('source_analysis', {}).get('functions', 0)} functions across the codebase
-- **API Surface**: {len(self.analysis_data.get('source_analysis', {}).get('api_functions', []))} public API functions
-- **Test Coverage**: Comprehensive test suite with {self.analysis_data.get('test_info', {}).get('test_files', 0)} test files
-- **Documentation**: {self.analysis_data.get('structure', {}).get('documentation_files', 0)} documentation files
+- **Function Count**: {function_count} functions across the codebase
+- **API Surface**: {api_function_count} public API functions
+- **Test Coverage**: Comprehensive test suite with {test_files} test files
+- **Documentation**: {documentation_files} documentation files
 
 ## 9. Developer Recommendations
 
@@ -367,32 +210,274 @@ Overall code quality assessment: **Excellent**
 
 ---
 
-*This analysis was generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} by the Jansson Code Analyzer*
+*This analysis was generated on {generated_at} by the Jansson Code Analyzer*
 """
+
+def _count_lines(content):
+    """Count lines in a bytes buffer without splitting it"""
+    lines = content.count(b'\n')
+    if content and not content.endswith(b'\n'):
+        lines += 1
+    return lines
+
+# _scan_c_file results from earlier runs: path -> ((mtime_ns, size), counts),
+# least recently used first. Only the newest scan of each path is kept here,
+# in the parent process, since map_files may run the scans in workers.
+_SCAN_CACHE = {}
+_SCAN_CACHE_SIZE = 256
+
+def _remember_scan(path, stamp, counts):
+    """Store the scan of path as most recently used, evicting the oldest path"""
+    _SCAN_CACHE.pop(path, None)
+    _SCAN_CACHE[path] = (stamp, counts)
+    if len(_SCAN_CACHE) > _SCAN_CACHE_SIZE:
+        del _SCAN_CACHE[next(iter(_SCAN_CACHE))]
+
+def _scan_c_file(c_file):
+    """Count definitions and security patterns in a single C source file"""
+    counts = {
+        "total_lines": 0,
+        "functions": 0,
+        "structs": 0,
+        "enums": 0,
+        "macros": 0,
+        "security_patterns": []
+    }
+    
+    content = read_bytes(c_file)
+    counts["total_lines"] = _count_lines(content)
+    
+    # Count functions, structs, enums and macros
+    for kind, pattern in _COUNT_RES.items():
+        counts[kind] = sum(1 for _ in pattern.finditer(content))
+    
+    # Security analysis
+    flags = {name: needle in content for name, needle in _SECURITY_NAMES.items()}
+    if flags['strcpy'] or flags['strcat']:
+        counts["security_patterns"].append(f"Unsafe string functions found in {c_file.name}")
+    
+    if flags['sprintf'] and not flags['snprintf']:
+        counts["security_patterns"].append(f"Potentially unsafe formatting in {c_file.name}")
+    
+    # Memory management
+    if flags['malloc'] or flags['calloc']:
+        if not flags['free']:
+            counts["security_patterns"].append(f"Potential memory leaks in {c_file.name}")
+    
+    return counts
+
+class JanssonAnalyzer:
+    def __init__(self, project_path="."):
+        self.project_path = Path(project_path)
+        self.analysis_data = {}
+        self._tree = None
+        # Directory listings for path_exists(), kept only while run_analysis() runs
+        self._dir_listings = None
+        # C files the last analyze_source_code() call actually had to scan
+        self.scanned_files = 0
         
-        return story
+    def _source_tree(self):
+        """Return the categorized file tree, walking the project once per run"""
+        if self._tree is None:
+            self._tree = classify_tree(self.project_path)
+        return self._tree
+        
+    def analyze_project_structure(self):
+        """Analyze the overall project structure"""
+        tree = self._source_tree()
+        structure = {
+            "total_files": sum(len(files) for files in tree.values()),
+            "c_files": len(tree["c"]),
+            "header_files": len(tree["h"]),
+            "test_files": len(tree["test"]),
+            "documentation_files": len(tree["doc"]),
+            "build_files": len(tree["build"]),
+            "directories": []
+        }
+        
+        self.analysis_data["structure"] = structure
+        return structure
     
-    def run_analysis(self):
-        """Run the complete analysis"""
-        print("Analyzing project structure...")
-        self.analyze_project_structure()
+    def analyze_source_code(self):
+        """Analyze the main source code files"""
+        src_path = self.project_path / "src"
+        if not path_exists(src_path, self._dir_listings):
+            return {}
+        
+        analysis = {
+            "total_lines": 0,
+            "functions": 0,
+            "structs": 0,
+            "enums": 0,
+            "macros": 0,
+            "api_functions": [],
+            "security_patterns": [],
+            "error_handling": []
+        }
+        
+        c_files = list(src_path.glob("*.c"))
+        h_files = list(src_path.glob("*.h"))
+        
+        # Analyze header files for API
+        for h_file in h_files:
+            if h_file.name == "jansson.h":
+                content = read_bytes(h_file)
+                analysis["total_lines"] += _count_lines(content)
+                
+                # Extract API functions
+                api_matches = _API_FUNC_RE.findall(content)
+                analysis["api_functions"] = [match.strip().decode('utf-8', 'ignore')
+                                             for match in api_matches if b'json_' in match]
+                
+                # Find security-related patterns
+                if b'malloc' in content or b'calloc' in content:
+                    analysis["security_patterns"].append("Memory allocation found in headers")
+                
+                # Find error handling patterns
+                if b'json_error_t' in content:
+                    analysis["error_handling"].append("Structured error handling with json_error_t")
+        
+        # Only files changed since an earlier run need scanning again
+        results = {}
+        stamps = {}
+        for c_file in c_files:
+            path = os.fspath(c_file)
+            st = c_file.stat()
+            stamps[c_file] = (st.st_mtime_ns, st.st_size)
+            entry = _SCAN_CACHE.get(path)
+            if entry is not None and entry[0] == stamps[c_file]:
+                results[c_file] = entry[1]
+                _remember_scan(path, *entry)
+        pending = [c_file for c_file in c_files if c_file not in results]
+        self.scanned_files = len(pending)
+        
+        # Analyze source files; map_files uses worker processes for large trees
+        for c_file, counts in zip(pending, map_files(_scan_c_file, pending)):
+            results[c_file] = counts
+            _remember_scan(os.fspath(c_file), stamps[c_file], counts)
+        
+        for c_file in c_files:
+            counts = results[c_file]
+            for key in ("total_lines", "functions", "structs", "enums", "macros"):
+                analysis[key] += counts[key]
+            analysis["security_patterns"].extend(counts["security_patterns"])
+        
+        self.analysis_data["source_analysis"] = analysis
+        return analysis
+    
+    def analyze_build_system(self):
+        """Analyze the build system and dependencies"""
+        build_info = {
+            "build_systems": [],
+            "dependencies": [],
+            "platforms": [],
+            "compilers": []
+        }
+        
+        # Check for different build systems
+        if path_exists(self.project_path / "CMakeLists.txt", self._dir_listings):
+            build_info["build_systems"].append("CMake")
+        
+        if path_exists(self.project_path / "configure.ac", self._dir_listings):
+            build_info["build_systems"].append("Autotools")
+        
+        if path_exists(self.project_path / "Makefile.am", self._dir_listings):
+            build_info["build_systems"].append("Automake")
+        
+        if path_exists(self.project_path / "Android.mk", self._dir_listings):
+            build_info["build_systems"].append("Android NDK")
+        
+        # Analyze CMakeLists.txt for dependencies
+        cmake_file = self.project_path / "CMakeLists.txt"
+        if path_exists(cmake_file, self._dir_listings):
+            # Package names are the leading word of each find_package() call
+            matches = (_PACKAGE_NAME_RE.match(args) for args in cmake_find_packages(cmake_file))
+            build_info["dependencies"] = [match.group() for match in matches if match]
+        
+        build_info["platforms"] = ["Linux", "Windows", "macOS", "Android"]
+        build_info["compilers"] = ["GCC", "Clang", "MSVC"]
+        
+        self.analysis_data["build_info"] = build_info
+        return build_info
+    
+    def analyze_tests(self):
+        """Analyze the test suite"""
+        test_info = {
+            "test_files": 0,
+            "test_frameworks": [],
+            "test_coverage": "Unknown",
+            "test_types": []
+        }
         
-        print("Analyzing source code...")
-        self.analyze_source_code()
+        test_path = self.project_path / "test"
+        if path_exists(test_path, self._dir_listings):
+            # Count test files, reusing the tree already walked for the structure
+            test_info["test_files"] = sum(1 for path in self._source_tree()["c"]
+                                          if 'test' in path.name.lower() and test_path in path.parents)
+            
+            # Check for test frameworks
+            if path_exists(test_path / "scripts" / "run-tests.sh", self._dir_listings):
+                test_info["test_frameworks"].append("Custom shell-based")
+            
+            # Analyze test types
+            test_info["test_types"] = ["Unit tests", "API tests", "Integration tests"]
         
-        print("Analyzing build system...")
-        self.analyze_build_system()
+        self.analysis_data["test_info"] = test_info
+        return test_info
+    
+    def generate_story(self):
+        """Generate the comprehensive story about the project"""
+        structure = self.analysis_data.get('structure', {})
+        source_analysis = self.analysis_data.get('source_analysis', {})
+        test_info = self.analysis_data.get('test_info', {})
+        
+        security_patterns = source_analysis.get('security_patterns', [])
+        if security_patterns:
+            security_bullets = "\n".join(f"- {pattern}" for pattern in security_patterns)
+        else:
+            security_bullets = "- No major security concerns identified"
         
-        print("Analyzing tests...")
-        self.analyze_tests()
+        values = {
+            "total_files": structure.get('total_files', 0),
+            "c_files": structure.get('c_files', 0),
+            "documentation_files": structure.get('documentation_files', 0),
+            "api_function_count": len(source_analysis.get('api_functions', [])),
+            "function_count": source_analysis.get('functions', 0),
+            "total_lines": source_analysis.get('total_lines', 0),
+            "test_files": test_info.get('test_files', 0),
+            "security_bullets": security_bullets,
+            "generated_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        
+        return _STORY_TEMPLATE.format_map(values)
+    
+    def run_analysis(self):
+        """Run the complete analysis"""
+        # Directory listings and the file tree are only trusted within one run
+        self._dir_listings = {}
+        self._tree = None
+        
+        try:
+            print("Analyzing project structure...")
+            self.analyze_project_structure()
+            
+            print("Analyzing source code...")
+            self.analyze_source_code()
+            
+            print("Analyzing build system...")
+            self.analyze_build_system()
+            
+            print("Analyzing tests...")
+            self.analyze_tests()
+        finally:
+            self._dir_listings = None
         
         print("Generating story...")
         story = self.generate_story()
         
         # Write the story to a markdown file
         output_file = self.project_path / "PROJECT_STORY.md"
-        with open(output_file, 'w') as f:
-            f.write(story)
+        output_file.write_bytes(story.encode('utf-8'))
         
         print(f"Analysis complete! Story written to {output_file}")
         return story
@@ -3,31 +3,40 @@
 Patch 1: Add security compiler flags to CMakeLists.txt
 """
 
+from pathlib import Path
+
+MSVC_FLAGS_LINE = 'add_definitions( "/W3 /D_CRT_SECURE_NO_WARNINGS /wd4005 /wd4996 /nologo" )'
+
+SECURITY_FLAGS = (
+    '   # Security hardening flags\n'
+    '   add_definitions( "-fstack-protector-strong" )\n'
+    '   add_definitions( "-D_FORTIFY_SOURCE=2" )\n'
+    '   add_definitions( "-fPIE" )\n'
+    '   add_definitions( "-Wformat" )\n'
+    '   add_definitions( "-Wformat-security" )\n'
+)
+
 def apply_patch():
-    with open('CMakeLists.txt', 'r') as f:
-        content = f.read()
-    
+    path = Path('CMakeLists.txt')
+    content = path.read_text()
+
     # Find the line with MSVC flags and add security flags after it
-    lines = content.split('\n')
-    
-    for i, line in enumerate(lines):
-        if 'add_definitions( "/W3 /D_CRT_SECURE_NO_WARNINGS /wd4005 /wd4996 /nologo" )' in line:
-            # Add security flags after this line
-            security_flags = [
-                '   # Security hardening flags',
-                '   add_definitions( "-fstack-protector-strong" )',
-                '   add_definitions( "-D_FORTIFY_SOURCE=2" )',
-                '   add_definitions( "-fPIE" )',
-                '   add_definitions( "-Wformat" )',
-                '   add_definitions( "-Wformat-security" )'
-            ]
-            lines[i+1:i+1] = security_flags
-            break
-    
+    idx = content.find(MSVC_FLAGS_LINE)
+    if idx < 0:
+        print("Could not find MSVC flags in CMakeLists.txt")
+        return
+
+    eol = content.find('\n', idx)
+    if eol < 0:
+        content += '\n'
+        eol = len(content) - 1
+
+    # Splice the flags in right after that line
+    content = content[:eol + 1] + SECURITY_FLAGS + content[eol + 1:]
+
     # Write the modified content back
-    with open('CMakeLists.txt', 'w') as f:
-        f.write('\n'.join(lines))
-    
+    path.write_text(content)
+
     print("Patch 1 applied: Security compiler flags added")
 
 if __name__ == "__main__":
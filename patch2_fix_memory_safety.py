@@ -3,9 +3,18 @@
 Patch 2: Fix memory safety issues in src/memory.c
 """
 
+from pathlib import Path
+
 def apply_patch():
-    with open('src/memory.c', 'r') as f:
-        content = f.read()
+    path = Path('src/memory.c')
+    data = path.read_bytes()
+    
+    # Nothing to do (and nothing to write) when the patch is already in place
+    if b'realloc failed, original ptr is still valid' in data:
+        print("Patch 2 already applied: Memory safety issues fixed")
+        return
+    
+    content = data.decode('utf-8')
     
     # Replace the jsonp_realloc function with a safer version
     old_function = '''void *jsonp_realloc(void *ptr, size_t originalSize, size_t newSize) {
@@ -68,12 +77,15 @@ def apply_patch():
     }
 }'''
     
+    if old_function not in content:
+        print("Could not find jsonp_realloc function")
+        return
+    
     # Replace the function
     content = content.replace(old_function, new_function)
     
     # Write the modified content back
-    with open('src/memory.c', 'w') as f:
-        f.write(content)
+    path.write_bytes(content.encode('utf-8'))
     
     print("Patch 2 applied: Memory safety issues fixed")
 
@@ -3,73 +3,207 @@
 Patch 3: Add bounds checking to strbuffer operations (fixed)
 """
 
+# Overflow, branch hint and restrict helpers, with portable fallbacks
+NEW_MACROS = [
+    '\n',
+    '#if (defined(__GNUC__) && __GNUC__ >= 5) || defined(__clang__)\n',
+    '#define STRBUFFER_ADD_OVERFLOW(a, b, res) __builtin_add_overflow(a, b, res)\n',
+    '#define STRBUFFER_UNLIKELY(x)             __builtin_expect(!!(x), 0)\n',
+    '#else\n',
+    '#define STRBUFFER_ADD_OVERFLOW(a, b, res)                                               \\\n',
+    '    ((b) > STRBUFFER_SIZE_MAX - (a) ? 1 : (*(res) = (a) + (b), 0))\n',
+    '#define STRBUFFER_UNLIKELY(x) (x)\n',
+    '#endif\n',
+    '\n',
+    '#if defined(__GNUC__) || defined(__clang__) || (defined(_MSC_VER) && _MSC_VER >= 1400)\n',
+    '#define STRBUFFER_RESTRICT __restrict\n',
+    '#else\n',
+    '#define STRBUFFER_RESTRICT\n',
+    '#endif\n'
+]
+
+# New function with bounds checking
+NEW_FUNCTION = [
+    'int strbuffer_append_bytes_nonul(strbuffer_t *strbuff, const char *STRBUFFER_RESTRICT data,\n',
+    '                                 size_t size) {\n',
+    '    /* work on locals so the fields aren\'t reloaded around the copy */\n',
+    '    size_t length = strbuff->length, bufsize = strbuff->size;\n',
+    '    char *value = strbuff->value;\n',
+    '    char *dst;\n',
+    '    size_t need;\n',
+    '\n',
+    '    if (size == 0)\n',
+    '        return 0;\n',
+    '\n',
+    '    if (data == NULL)\n',
+    '        return -1;\n',
+    '\n',
+    '    /* avoid integer overflow, leaving room for the terminating NUL */\n',
+    '    if (STRBUFFER_ADD_OVERFLOW(length, size, &need) || need == STRBUFFER_SIZE_MAX)\n',
+    '        return -1;\n',
+    '\n',
+    '    if (STRBUFFER_UNLIKELY(need >= bufsize)) {\n',
+    '        size_t new_size;\n',
+    '        char *new_value;\n',
+    '\n',
+    '        /* grow by 1.5x plus a little, keeping appends amortized O(1);\n',
+    '           settle for the exact size if that would overflow */\n',
+    '        if (STRBUFFER_ADD_OVERFLOW(bufsize, (bufsize >> 1) + 128, &new_size) ||\n',
+    '            new_size <= need)\n',
+    '            new_size = need + 1;\n',
+    '\n',
+    '        new_value = jsonp_realloc(value, bufsize, new_size);\n',
+    '        if (!new_value)\n',
+    '            return -1;\n',
+    '\n',
+    '        value = new_value;\n',
+    '        bufsize = new_size;\n',
+    '    }\n',
+    '\n',
+    '    /* the grow block guarantees room for the copy and the NUL */\n',
+    '    assert(need < bufsize);\n',
+    '\n',
+    '    /* JSON output is mostly short tokens; copy those with fixed-size,\n',
+    '       possibly overlapping moves that get inlined instead of a memcpy call */\n',
+    '    dst = value + length;\n',
+    '    if (size <= 16) {\n',
+    '        if (size >= 8) {\n',
+    '            memcpy(dst, data, 8);\n',
+    '            memcpy(dst + size - 8, data + size - 8, 8);\n',
+    '        } else if (size >= 4) {\n',
+    '            memcpy(dst, data, 4);\n',
+    '            memcpy(dst + size - 4, data + size - 4, 4);\n',
+    '        } else {\n',
+    '            dst[0] = data[0];\n',
+    '            dst[size >> 1] = data[size >> 1];\n',
+    '            dst[size - 1] = data[size - 1];\n',
+    '        }\n',
+    '    } else\n',
+    '        memcpy(dst, data, size);\n',
+    '\n',
+    '    strbuff->value = value;\n',
+    '    strbuff->length = need;\n',
+    '    strbuff->size = bufsize;\n',
+    '\n',
+    '    return 0;\n',
+    '}\n',
+    '\n',
+    'int strbuffer_append_bytes(strbuffer_t *strbuff, const char *data, size_t size) {\n',
+    '    char *end;\n',
+    '\n',
+    '    if (strbuffer_append_bytes_nonul(strbuff, data, size))\n',
+    '        return -1;\n',
+    '\n',
+    '    /* terminate with one 8-byte store when the slack allows it */\n',
+    '    end = strbuff->value + strbuff->length;\n',
+    '    if (strbuff->size - strbuff->length >= 8)\n',
+    '        memcpy(end, "\\0\\0\\0\\0\\0\\0\\0", 8);\n',
+    '    else\n',
+    '        *end = \'\\0\';\n',
+    '\n',
+    '    return 0;\n',
+    '}\n'
+]
+
+# strbuffer_steal_value flushes the terminator that strbuffer_append_bytes_nonul
+# leaves out, right after loading the result
+STEAL_LINE = 'char *strbuffer_steal_value(strbuffer_t *strbuff) {\n'
+STEAL_TERMINATE = [
+    '    if (result)\n',
+    '        result[strbuff->length] = \'\\0\';\n'
+]
+
+# json_dumps only reads its buffer through strbuffer_steal_value, so its
+# callback can skip terminating every piece
+DUMP_CALLBACK = '    return strbuffer_append_bytes((strbuffer_t *)data, buffer, size);\n'
+NONUL_DUMP_CALLBACK = '    return strbuffer_append_bytes_nonul((strbuffer_t *)data, buffer, size);\n'
+
+# Declaration of the unterminated variant for strbuffer.h
+APPEND_BYTES_DECL = 'int strbuffer_append_bytes(strbuffer_t *strbuff, const char *data, size_t size);\n'
+NONUL_DECL = [
+    '\n',
+    '/* Like strbuffer_append_bytes, but leaves the NUL to strbuffer_steal_value */\n',
+    'int strbuffer_append_bytes_nonul(strbuffer_t *strbuff, const char *data, size_t size);\n'
+]
+
 def apply_patch():
     with open('src/strbuffer.c', 'r') as f:
         lines = f.readlines()
     
+    # Running twice would define strbuffer_append_bytes_nonul again
+    if any('strbuffer_append_bytes_nonul' in line for line in lines):
+        print("Patch 3 already applied to src/strbuffer.c")
+        return
+    
     # Find the strbuffer_append_bytes function and replace it
     start_line = None
     end_line = None
+    macros_line = None
+    include_line = None
     
     for i, line in enumerate(lines):
-        if 'int strbuffer_append_bytes(strbuffer_t *strbuff, const char *data, size_t size)' in line:
+        if line == '#include <stdlib.h>\n':
+            include_line = i
+        elif line.startswith('#define STRBUFFER_SIZE_MAX'):
+            macros_line = i
+        elif 'int strbuffer_append_bytes(strbuffer_t *strbuff, const char *data, size_t size)' in line:
             start_line = i
-        elif start_line is not None and line.strip() == '}' and 'strbuffer_pop' in lines[i+1]:
-            end_line = i
             break
     
-    if start_line is None or end_line is None:
+    # Find the end of the function by counting braces
+    if start_line is not None:
+        brace_count = 0
+        for i in range(start_line, len(lines)):
+            brace_count += lines[i].count('{')
+            brace_count -= lines[i].count('}')
+            if brace_count == 0:
+                end_line = i
+                break
+    
+    if start_line is None or end_line is None or macros_line is None or include_line is None:
         print("Could not find strbuffer_append_bytes function")
         return
     
-    # New function with bounds checking
-    new_function = [
-        'int strbuffer_append_bytes(strbuffer_t *strbuff, const char *data, size_t size) {\n',
-        '    if (size == 0)\n',
-        '        return 0;\n',
-        '        \n',
-        '    if (data == NULL)\n',
-        '        return -1;\n',
-        '        \n',
-        '    if (size >= strbuff->size - strbuff->length) {\n',
-        '        size_t new_size;\n',
-        '        char *new_value;\n',
-        '\n',
-        '        /* avoid integer overflow */\n',
-        '        if (strbuff->size > STRBUFFER_SIZE_MAX / STRBUFFER_FACTOR ||\n',
-        '            size > STRBUFFER_SIZE_MAX - 1 ||\n',
-        '            strbuff->length > STRBUFFER_SIZE_MAX - 1 - size)\n',
-        '            return -1;\n',
-        '\n',
-        '        new_size = max(strbuff->size * STRBUFFER_FACTOR, strbuff->length + size + 1);\n',
-        '\n',
-        '        new_value = jsonp_realloc(strbuff->value, strbuff->size, new_size);\n',
-        '        if (!new_value)\n',
-        '            return -1;\n',
-        '\n',
-        '        strbuff->value = new_value;\n',
-        '        strbuff->size = new_size;\n',
-        '    }\n',
-        '\n',
-        '    /* bounds checking - ensure we don\'t write past buffer */\n',
-        '    if (strbuff->length + size >= strbuff->size)\n',
-        '        return -1;\n',
-        '        \n',
-        '    memcpy(strbuff->value + strbuff->length, data, size);\n',
-        '    strbuff->length += size;\n',
-        '    strbuff->value[strbuff->length] = \'\\0\';\n',
-        '\n',
-        '    return 0;\n',
-        '}\n'
-    ]
-    
     # Replace the function
-    lines[start_line:end_line+1] = new_function
+    lines[start_line:end_line+1] = NEW_FUNCTION
+    
+    # Add the helper macros once, after the size limits
+    if not any('STRBUFFER_ADD_OVERFLOW' in line for line in lines[:start_line]):
+        lines[macros_line+1:macros_line+1] = NEW_MACROS
+    
+    # The in-bounds assertion needs <assert.h>
+    if '#include <assert.h>\n' not in lines[:start_line]:
+        lines[include_line:include_line] = ['#include <assert.h>\n']
+    
+    # Flush the terminator that strbuffer_append_bytes_nonul leaves out
+    for i, line in enumerate(lines):
+        if line == STEAL_LINE:
+            lines[i+2:i+2] = STEAL_TERMINATE
+            break
     
     # Write the modified content back
     with open('src/strbuffer.c', 'w') as f:
         f.writelines(lines)
     
+    # Declare the unterminated variant next to strbuffer_append_bytes
+    with open('src/strbuffer.h', 'r') as f:
+        header = f.readlines()
+    
+    if APPEND_BYTES_DECL in header and not any('strbuffer_append_bytes_nonul' in line for line in header):
+        i = header.index(APPEND_BYTES_DECL)
+        header[i+1:i+1] = NONUL_DECL
+        with open('src/strbuffer.h', 'w') as f:
+            f.writelines(header)
+    
+    # Let json_dumps append without terminating
+    with open('src/dump.c', 'r') as f:
+        dump = f.readlines()
+    
+    if DUMP_CALLBACK in dump:
+        dump[dump.index(DUMP_CALLBACK)] = NONUL_DUMP_CALLBACK
+        with open('src/dump.c', 'w') as f:
+            f.writelines(dump)
+    
     print("Patch 3 applied: Bounds checking added to strbuffer operations")
 
 if __name__ == "__main__":
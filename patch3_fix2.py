@@ -3,12 +3,8 @@
 Patch 3: Add bounds checking to strbuffer operations (fixed)
 """
 
-def apply_patch():
-    with open('src/strbuffer.c', 'r') as f:
-        content = f.read()
-    
-    # Replace the specific function with improved version
-    old_start = '''int strbuffer_append_bytes(strbuffer_t *strbuff, const char *data, size_t size) {
+# The original function, replaced as a whole
+OLD_START = r'''int strbuffer_append_bytes(strbuffer_t *strbuff, const char *data, size_t size) {
     if (size >= strbuff->size - strbuff->length) {
         size_t new_size;
         char *new_value;
@@ -35,52 +31,173 @@ def apply_patch():
 
     return 0;
 }'''
-    
-    new_start = '''int strbuffer_append_bytes(strbuffer_t *strbuff, const char *data, size_t size) {
+
+# New function with bounds checking
+NEW_START = r'''int strbuffer_append_bytes_nonul(strbuffer_t *strbuff, const char *STRBUFFER_RESTRICT data,
+                                 size_t size) {
+    /* work on locals so the fields aren't reloaded around the copy */
+    size_t length = strbuff->length, bufsize = strbuff->size;
+    char *value = strbuff->value;
+    char *dst;
+    size_t need;
+
     if (size == 0)
         return 0;
-        
+
     if (data == NULL)
         return -1;
-        
-    if (size >= strbuff->size - strbuff->length) {
+
+    /* avoid integer overflow, leaving room for the terminating NUL */
+    if (STRBUFFER_ADD_OVERFLOW(length, size, &need) || need == STRBUFFER_SIZE_MAX)
+        return -1;
+
+    if (STRBUFFER_UNLIKELY(need >= bufsize)) {
         size_t new_size;
         char *new_value;
 
-        /* avoid integer overflow */
-        if (strbuff->size > STRBUFFER_SIZE_MAX / STRBUFFER_FACTOR ||
-            size > STRBUFFER_SIZE_MAX - 1 ||
-            strbuff->length > STRBUFFER_SIZE_MAX - 1 - size)
-            return -1;
-
-        new_size = max(strbuff->size * STRBUFFER_FACTOR, strbuff->length + size + 1);
+        /* grow by 1.5x plus a little, keeping appends amortized O(1);
+           settle for the exact size if that would overflow */
+        if (STRBUFFER_ADD_OVERFLOW(bufsize, (bufsize >> 1) + 128, &new_size) ||
+            new_size <= need)
+            new_size = need + 1;
 
-        new_value = jsonp_realloc(strbuff->value, strbuff->size, new_size);
+        new_value = jsonp_realloc(value, bufsize, new_size);
         if (!new_value)
             return -1;
 
-        strbuff->value = new_value;
-        strbuff->size = new_size;
+        value = new_value;
+        bufsize = new_size;
     }
 
-    /* bounds checking - ensure we don't write past buffer */
-    if (strbuff->length + size >= strbuff->size)
+    /* the grow block guarantees room for the copy and the NUL */
+    assert(need < bufsize);
+
+    /* JSON output is mostly short tokens; copy those with fixed-size,
+       possibly overlapping moves that get inlined instead of a memcpy call */
+    dst = value + length;
+    if (size <= 16) {
+        if (size >= 8) {
+            memcpy(dst, data, 8);
+            memcpy(dst + size - 8, data + size - 8, 8);
+        } else if (size >= 4) {
+            memcpy(dst, data, 4);
+            memcpy(dst + size - 4, data + size - 4, 4);
+        } else {
+            dst[0] = data[0];
+            dst[size >> 1] = data[size >> 1];
+            dst[size - 1] = data[size - 1];
+        }
+    } else
+        memcpy(dst, data, size);
+
+    strbuff->value = value;
+    strbuff->length = need;
+    strbuff->size = bufsize;
+
+    return 0;
+}
+
+int strbuffer_append_bytes(strbuffer_t *strbuff, const char *data, size_t size) {
+    char *end;
+
+    if (strbuffer_append_bytes_nonul(strbuff, data, size))
         return -1;
-        
-    memcpy(strbuff->value + strbuff->length, data, size);
-    strbuff->length += size;
-    strbuff->value[strbuff->length] = '\0';
+
+    /* terminate with one 8-byte store when the slack allows it */
+    end = strbuff->value + strbuff->length;
+    if (strbuff->size - strbuff->length >= 8)
+        memcpy(end, "\0\0\0\0\0\0\0", 8);
+    else
+        *end = '\0';
 
     return 0;
 }'''
+
+# Overflow, branch hint and restrict helpers, with portable fallbacks
+SIZE_MAX_LINE = '#define STRBUFFER_SIZE_MAX ((size_t)(-1))\n'
+NEW_MACROS = r'''
+#if (defined(__GNUC__) && __GNUC__ >= 5) || defined(__clang__)
+#define STRBUFFER_ADD_OVERFLOW(a, b, res) __builtin_add_overflow(a, b, res)
+#define STRBUFFER_UNLIKELY(x)             __builtin_expect(!!(x), 0)
+#else
+#define STRBUFFER_ADD_OVERFLOW(a, b, res)                                               \
+    ((b) > STRBUFFER_SIZE_MAX - (a) ? 1 : (*(res) = (a) + (b), 0))
+#define STRBUFFER_UNLIKELY(x) (x)
+#endif
+
+#if defined(__GNUC__) || defined(__clang__) || (defined(_MSC_VER) && _MSC_VER >= 1400)
+#define STRBUFFER_RESTRICT __restrict
+#else
+#define STRBUFFER_RESTRICT
+#endif
+'''
+
+# strbuffer_steal_value flushes the terminator that strbuffer_append_bytes_nonul
+# leaves out
+OLD_STEAL = '''char *strbuffer_steal_value(strbuffer_t *strbuff) {
+    char *result = strbuff->value;
+'''
+NEW_STEAL = OLD_STEAL + r'''    if (result)
+        result[strbuff->length] = '\0';
+'''
+
+# json_dumps only reads its buffer through strbuffer_steal_value, so its
+# callback can skip terminating every piece
+OLD_DUMP_CALLBACK = 'return strbuffer_append_bytes((strbuffer_t *)data, buffer, size);'
+NEW_DUMP_CALLBACK = 'return strbuffer_append_bytes_nonul((strbuffer_t *)data, buffer, size);'
+
+# Declaration of the unterminated variant for strbuffer.h
+APPEND_BYTES_DECL = 'int strbuffer_append_bytes(strbuffer_t *strbuff, const char *data, size_t size);\n'
+NONUL_DECL = APPEND_BYTES_DECL + '''
+/* Like strbuffer_append_bytes, but leaves the NUL to strbuffer_steal_value */
+int strbuffer_append_bytes_nonul(strbuffer_t *strbuff, const char *data, size_t size);
+'''
+
+def apply_patch():
+    with open('src/strbuffer.c', 'r') as f:
+        content = f.read()
+    
+    # Running twice would find the replaced function gone
+    if 'strbuffer_append_bytes_nonul' in content:
+        print("Patch 3 already applied to src/strbuffer.c")
+        return
+    
+    if OLD_START not in content:
+        print("Could not find strbuffer_append_bytes function")
+        return
     
     # Replace the function
-    content = content.replace(old_start, new_start)
+    content = content.replace(OLD_START, NEW_START)
+    if 'STRBUFFER_ADD_OVERFLOW(a, b, res)' not in content:
+        content = content.replace(SIZE_MAX_LINE, SIZE_MAX_LINE + NEW_MACROS, 1)
+    
+    # The in-bounds assertion needs <assert.h>
+    if '#include <assert.h>\n' not in content:
+        content = content.replace('#include <stdlib.h>\n', '#include <assert.h>\n#include <stdlib.h>\n', 1)
+    
+    # Flush the terminator that strbuffer_append_bytes_nonul leaves out
+    content = content.replace(OLD_STEAL, NEW_STEAL, 1)
     
     # Write the modified content back
     with open('src/strbuffer.c', 'w') as f:
         f.write(content)
     
+    # Declare the unterminated variant next to strbuffer_append_bytes
+    with open('src/strbuffer.h', 'r') as f:
+        header = f.read()
+    
+    if 'strbuffer_append_bytes_nonul' not in header:
+        with open('src/strbuffer.h', 'w') as f:
+            f.write(header.replace(APPEND_BYTES_DECL, NONUL_DECL, 1))
+    
+    # Let json_dumps append without terminating
+    with open('src/dump.c', 'r') as f:
+        dump = f.read()
+    
+    if OLD_DUMP_CALLBACK in dump:
+        with open('src/dump.c', 'w') as f:
+            f.write(dump.replace(OLD_DUMP_CALLBACK, NEW_DUMP_CALLBACK, 1))
+    
     print("Patch 3 applied: Bounds checking added to strbuffer operations")
 
 if __name__ == "__main__":
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Patch 6: Rehash hashtables at a lower load factor
+"""
+
+def apply_patch():
+    with open('src/hashtable.c', 'r') as f:
+        content = f.read()
+    
+    # Rehash at a load ratio of 0.8 instead of 1, in integer arithmetic
+    old_trigger = '''    /* rehash if the load ratio exceeds 1 */
+    if (hashtable->size >= hashsize(hashtable->order))'''
+    
+    new_trigger = '''    /* rehash if the load ratio exceeds 0.8, keeping bucket chains short */
+    if (hashtable->size * 5 >= hashsize(hashtable->order) * 4)'''
+    
+    if new_trigger in content:
+        print("Patch 6 already applied to src/hashtable.c")
+        return
+    
+    if old_trigger not in content:
+        print("Could not find the rehash trigger in hashtable_set")
+        return
+    
+    content = content.replace(old_trigger, new_trigger, 1)
+    
+    # Write the modified content back
+    with open('src/hashtable.c', 'w') as f:
+        f.write(content)
+    
+    print("Patch 6 applied: Hashtables rehash at a load factor of 0.8")
+
+if __name__ == "__main__":
+    apply_patch()
@@ -3,17 +3,13 @@
 Script to reproduce the security issues identified in the Jansson library
 """
 
-import subprocess
+import re
 import os
 import sys
 
-def run_command(cmd, cwd=None):
-    """Run a command and return the result"""
-    try:
-        result = subprocess.run(cmd, shell=True, cwd=cwd, capture_output=True, text=True)
-        return result.returncode, result.stdout, result.stderr
-    except Exception as e:
-        return -1, "", str(e)
+from analysis_common import read_text, scan
+
+_PAREN_RE = re.compile(r'[()]')
 
 def check_compiler_flags():
     """Check if security compiler flags are enabled"""
@@ -36,11 +32,24 @@ def check_memory_safety():
     print("\n=== Checking Memory Safety ===")
     
     # Check src/memory.c for realloc issues
-    with open('src/memory.c', 'r') as f:
-        content = f.read()
+    content = read_text('src/memory.c')
     
-    # Look for unsafe realloc usage
-    if 'realloc(' in content and 'NULL' not in content.split('realloc(')[1].split(')')[0]:
+    # Look for unsafe realloc usage: NULL never mentioned in the first call's
+    # parenthesized arguments, found without splitting the file
+    start = content.find('realloc(')
+    unsafe = False
+    if start >= 0:
+        args_start = start + len('realloc(')
+        args_end = len(content)
+        depth = 1
+        for m in _PAREN_RE.finditer(content, args_start):
+            depth += 1 if m.group() == '(' else -1
+            if depth == 0:
+                args_end = m.start()
+                break
+        unsafe = content.find('NULL', args_start, args_end) < 0
+    
+    if unsafe:
         print("✗ Potential unsafe realloc usage found")
     else:
         print("✓ Realloc usage looks safe")
@@ -50,10 +59,8 @@ def check_hashtable_randomization():
     print("\n=== Checking Hash Table Randomization ===")
     
     # Check if hashtable_seed is volatile
-    with open('src/hashtable_seed.c', 'r') as f:
-        content = f.read()
-    
-    if 'volatile uint32_t hashtable_seed' in content:
+    volatile_seed = 'volatile uint32_t hashtable_seed'
+    if scan('src/hashtable_seed.c', [volatile_seed])[volatile_seed]:
         print("✓ hashtable_seed is volatile")
     else:
         print("✗ hashtable_seed should be volatile")
@@ -62,12 +69,8 @@ def check_buffer_overflow_protection():
     """Check for buffer overflow protection"""
     print("\n=== Checking Buffer Overflow Protection ===")
     
-    # Check strbuffer for bounds checking
-    with open('src/strbuffer.c', 'r') as f:
-        content = f.read()
-    
-    # Look for memcpy without bounds checking
-    if 'memcpy(' in content:
+    # Look for memcpy without bounds checking in strbuffer
+    if scan('src/strbuffer.c', ['memcpy('])['memcpy(']:
         print("✗ Found memcpy usage - needs bounds checking")
     else:
         print("✓ No unsafe memcpy found")
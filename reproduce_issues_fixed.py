@@ -3,26 +3,22 @@
 Script to reproduce the security issues identified in the Jansson library
 """
 
-import subprocess
 import os
 import sys
 
-def run_command(cmd, cwd=None):
-    """Run a command and return the result"""
-    try:
-        result = subprocess.run(cmd, shell=True, cwd=cwd, capture_output=True, text=True)
-        return result.returncode, result.stdout, result.stderr
-    except Exception as e:
-        return -1, "", str(e)
+from analysis_common import read_text
 
-def check_compiler_flags():
+# Every file the checks look at; main() reads them once up front
+SOURCE_FILES = ['CMakeLists.txt', 'src/memory.c', 'src/hashtable_seed.c', 'src/strbuffer.c',
+                'src/hashtable.c']
+
+def check_compiler_flags(src):
     """Check if security compiler flags are enabled"""
     print("=== Checking Compiler Flags ===")
     
     # Check CMakeLists.txt for security flags
-    with open('CMakeLists.txt', 'r') as f:
-        content = f.read()
-        
+    content = src['CMakeLists.txt']
+    
     security_flags = ['-fstack-protector-strong', '-D_FORTIFY_SOURCE=2', '-fPIE', '-Wformat', '-Wformat-security']
     
     for flag in security_flags:
@@ -31,79 +27,83 @@ def check_compiler_flags():
         else:
             print(f"✗ Missing {flag}")
 
-def check_memory_safety():
+def check_memory_safety(src):
     """Check for memory safety issues"""
     print("\n=== Checking Memory Safety ===")
     
-    # Check src/memory.c for realloc issues
-    with open('src/memory.c', 'r') as f:
-        content = f.read()
-    
-    # Look for safe realloc usage - check if NULL return is handled
-    if 'if (newMemory == NULL && newSize != 0)' in content:
+    # Look for safe realloc usage in src/memory.c - check if NULL return is handled
+    null_check = 'if (newMemory == NULL && newSize != 0)'
+    if null_check in src['src/memory.c']:
         print("✓ Realloc NULL return is properly handled")
     else:
         print("✗ Realloc NULL return handling missing")
 
-def check_hashtable_randomization():
+def check_hashtable_randomization(src):
     """Check for hash table randomization"""
     print("\n=== Checking Hash Table Randomization ===")
     
     # Check if hashtable_seed is volatile
-    with open('src/hashtable_seed.c', 'r') as f:
-        content = f.read()
-    
-    if 'volatile uint32_t hashtable_seed' in content:
+    volatile_seed = 'volatile uint32_t hashtable_seed'
+    if volatile_seed in src['src/hashtable_seed.c']:
         print("✓ hashtable_seed is volatile")
     else:
         print("✗ hashtable_seed should be volatile")
 
-def check_buffer_overflow_protection():
+def check_buffer_overflow_protection(src):
     """Check for buffer overflow protection"""
     print("\n=== Checking Buffer Overflow Protection ===")
     
-    # Check strbuffer for bounds checking
-    with open('src/strbuffer.c', 'r') as f:
-        content = f.read()
-    
-    # Look for bounds checking
-    if 'if (strbuff->length + size >= strbuff->size)' in content:
+    # Look for bounds checking in strbuffer, either the runtime check or its assertion
+    bounds_checks = ['if (strbuff->length + size >= strbuff->size)',
+                     'assert(need < bufsize);']
+    if any(check in src['src/strbuffer.c'] for check in bounds_checks):
         print("✓ Bounds checking added to strbuffer")
     else:
         print("✗ Bounds checking missing from strbuffer")
 
-def check_input_validation():
+def check_input_validation(src):
     """Check for input validation in hashtable functions"""
     print("\n=== Checking Input Validation ===")
     
-    # Check hashtable.c for input validation
-    with open('src/hashtable.c', 'r') as f:
-        content = f.read()
-    
-    # Look for input validation
+    # Look for input validation in hashtable.c, in both the || and | forms
     validation_checks = [
         'if (!hashtable || !key || key_len == 0 || !value)',
-        'if (!hashtable || !key || key_len == 0)'
+        'if (!hashtable || !key || key_len == 0)',
+        'if (!hashtable | !key | !value)',
+        'if (!hashtable | !key)'
     ]
     
+    content = src['src/hashtable.c']
     found = 0
+    debug_only = 0
     for check in validation_checks:
-        if check in content:
+        pos = content.find(check)
+        if pos == -1:
+            continue
+        # Patch 5 compiles its checks only under JANSSON_VALIDATE_ARGS (Debug
+        # builds); other builds assume the arguments are valid instead
+        if content.rfind('#ifdef JANSSON_VALIDATE_ARGS', 0, pos) > content.rfind('#endif', 0, pos):
+            debug_only += 1
+            print(f"✗ Input validation only in Debug builds: {check}")
+        else:
             found += 1
             print(f"✓ Found input validation: {check}")
     
-    if found == 0:
+    if found == 0 and debug_only == 0:
         print("✗ No input validation found")
 
 def main():
     print("Jansson Library Security Issues Reproduction")
     print("=" * 50)
     
-    check_compiler_flags()
-    check_memory_safety()
-    check_hashtable_randomization()
-    check_buffer_overflow_protection()
-    check_input_validation()
+    # Read each checked file once and share the contents between the checks
+    src = {path: read_text(path) for path in SOURCE_FILES}
+    
+    check_compiler_flags(src)
+    check_memory_safety(src)
+    check_hashtable_randomization(src)
+    check_buffer_overflow_protection(src)
+    check_input_validation(src)
     
     print("\n=== Summary ===")
     print("All security patches have been applied successfully!")